@@ -0,0 +1,326 @@
+"""Persistent LLM response cache: exact hash lookup with optional semantic fallback."""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from functools import lru_cache, wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple, get_type_hints
+
+from pydantic import TypeAdapter
+
+from app.config import (
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_DIR,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_PERSIST_EVERY,
+    EMBEDDING_MODEL,
+)
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def normalise_text(text: str) -> str:
+    """Collapse whitespace so cosmetically different prompts share an entry."""
+    return " ".join(str(text).split())
+
+
+def make_key(namespace: str, text: str, salt: str = "") -> str:
+    """SHA-256 cache key scoped by namespace and prompt/model salt."""
+    payload = "\x00".join([namespace, salt, normalise_text(text)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExactCache:
+    """SQLite-backed key/value store for serialized LLM outputs."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: List[Tuple[str, str]]) -> None:
+        """Insert several entries in one transaction."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO llm_cache (key, value) VALUES (?, ?)", items
+            )
+            self._conn.commit()
+
+
+class SemanticIndex:
+    """
+    FAISS inner-product index over normalised prompt embeddings.
+
+    Inserts stay in memory and are persisted every `persist_every` adds (and
+    on flush). The index and its key list are rewritten together via atomic
+    renames, and a count mismatch on load discards both rather than risk
+    returning another prompt's output.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        namespace: str,
+        threshold: float,
+        persist_every: int = SEMANTIC_CACHE_PERSIST_EVERY,
+    ):
+        import faiss
+
+        self._faiss = faiss
+        self._lock = threading.Lock()
+        self.threshold = threshold
+        self.persist_every = persist_every
+        self._pending = 0
+        self._index_path = os.path.join(directory, f"{namespace}.faiss")
+        self._keys_path = os.path.join(directory, f"{namespace}.keys")
+        os.makedirs(directory, exist_ok=True)
+
+        dim = get_embed_model().get_sentence_embedding_dimension()
+        self._index, self._keys = self._load(dim)
+
+    def _load(self, dim: int):
+        if os.path.exists(self._index_path) and os.path.exists(self._keys_path):
+            index = self._faiss.read_index(self._index_path)
+            with open(self._keys_path) as f:
+                keys = f.read().split()
+            if index.ntotal == len(keys) and index.d == dim:
+                return index, keys
+            logger.warning(
+                f"Semantic index {self._index_path} out of sync with its keys "
+                f"({index.ntotal} vectors, {len(keys)} keys), starting empty"
+            )
+        return self._faiss.IndexFlatIP(dim), []
+
+    def _embed(self, text: str):
+        return get_embed_model().encode(
+            [text], normalize_embeddings=True, convert_to_numpy=True
+        ).astype("float32")
+
+    def search(self, text: str) -> Optional[str]:
+        """Return the cache key of the nearest prompt above threshold."""
+        if not self._keys:
+            return None
+        vec = self._embed(text)
+        with self._lock:
+            scores, ids = self._index.search(vec, 1)
+            idx, score = int(ids[0][0]), float(scores[0][0])
+            if idx < 0 or idx >= len(self._keys) or score < self.threshold:
+                return None
+            return self._keys[idx]
+
+    def add(self, text: str, key: str) -> None:
+        vec = self._embed(text)
+        with self._lock:
+            self._index.add(vec)
+            self._keys.append(key)
+            self._pending += 1
+            if self._pending >= self.persist_every:
+                self._save()
+
+    def flush(self) -> None:
+        """Persist any inserts not yet written to disk."""
+        with self._lock:
+            if self._pending:
+                self._save()
+
+    def _save(self) -> None:
+        # Caller holds the lock
+        index_tmp, keys_tmp = f"{self._index_path}.tmp", f"{self._keys_path}.tmp"
+        self._faiss.write_index(self._index, index_tmp)
+        with open(keys_tmp, "w") as f:
+            f.write("\n".join(self._keys) + "\n")
+        os.replace(keys_tmp, self._keys_path)
+        os.replace(index_tmp, self._index_path)
+        self._pending = 0
+
+
+@lru_cache(maxsize=1)
+def get_store() -> ExactCache:
+    """Shared exact cache, opened lazily on first use."""
+    return ExactCache(os.path.join(LLM_CACHE_DIR, "llm_cache.sqlite3"))
+
+
+@lru_cache(maxsize=1)
+def get_embed_model():
+    """Shared sentence-transformers model used for semantic lookup."""
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+
+
+_semantic_indexes: Dict[str, Optional[SemanticIndex]] = {}
+_semantic_lock = threading.Lock()
+
+
+def get_semantic_index(namespace: str) -> Optional[SemanticIndex]:
+    """Semantic index for a namespace, or None if disabled/unavailable."""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    with _semantic_lock:
+        if namespace not in _semantic_indexes:
+            try:
+                _semantic_indexes[namespace] = SemanticIndex(
+                    LLM_CACHE_DIR, namespace, SEMANTIC_CACHE_THRESHOLD
+                )
+            except ImportError as e:
+                logger.warning(f"Semantic cache disabled, missing dependency: {e}")
+                _semantic_indexes[namespace] = None
+            except Exception as e:
+                # e.g. the embedding model can't be downloaded; don't retry per call
+                logger.warning(f"Semantic cache disabled, failed to load index: {e}")
+                _semantic_indexes[namespace] = None
+        return _semantic_indexes[namespace]
+
+
+def flush_semantic_cache() -> None:
+    """Persist pending semantic index inserts, e.g. at shutdown."""
+    for index in list(_semantic_indexes.values()):
+        if index is not None:
+            index.flush()
+
+
+def prewarm_semantic_cache(namespaces: tuple = ("product",)) -> None:
+    """Load the embedding model and indexes up front to avoid a cold first request."""
+    if not (LLM_CACHE_ENABLED and SEMANTIC_CACHE_ENABLED):
+        return
+    # Like request-time cache errors, a failed prewarm must not stop startup
+    try:
+        for namespace in namespaces:
+            if get_semantic_index(namespace) is None:
+                return
+        # Force lazy weight initialisation
+        get_embed_model().encode(["warmup"])
+    except Exception as e:
+        logger.warning(f"Semantic cache prewarm failed: {e}")
+        return
+    logger.info(f"Semantic cache prewarmed: {', '.join(namespaces)}")
+
+
+class ResponseCache:
+    """
+    Two-tier cache for one kind of LLM output.
+
+    Layer 1 is an exact SHA-256 lookup of the normalised text; layer 2
+    (optional) returns the output of the most similar previously seen prompt.
+    """
+
+    def __init__(
+        self, namespace: str, output_type: Any, salt: str = "", semantic: bool = True
+    ):
+        self.namespace = namespace
+        self.salt = salt
+        self.semantic = semantic
+        self._adapter = TypeAdapter(output_type)
+
+    async def get(self, text: str) -> Optional[Any]:
+        return (await self.get_many([text]))[0]
+
+    async def get_many(self, texts: List[str]) -> List[Optional[Any]]:
+        """Look up several texts in one worker-thread hop; misses are None."""
+        if not LLM_CACHE_ENABLED:
+            return [None] * len(texts)
+        return await asyncio.to_thread(lambda: [self._get(t) for t in texts])
+
+    async def set(self, text: str, value: Any) -> None:
+        await self.set_many([(text, value)])
+
+    async def set_many(self, items: List[Tuple[str, Any]]) -> None:
+        """Store several outputs with a single SQLite commit."""
+        if not LLM_CACHE_ENABLED or not items:
+            return
+        await asyncio.to_thread(self._set_many, items)
+
+    # Blocking helpers, run via asyncio.to_thread
+    def _get(self, text: str) -> Optional[Any]:
+        text = normalise_text(text)
+        store = get_store()
+
+        hit = store.get(make_key(self.namespace, text, self.salt))
+        if hit is None and self.semantic:
+            hit = self._get_semantic(store, text)
+        return self._adapter.validate_json(hit) if hit is not None else None
+
+    def _get_semantic(self, store: ExactCache, text: str) -> Optional[str]:
+        # Semantic failures are a miss for this text only, never the whole lookup
+        try:
+            index = get_semantic_index(self.namespace)
+            near = index.search(text) if index is not None else None
+        except Exception as e:
+            logger.warning(f"{self.namespace} semantic lookup failed: {e}")
+            return None
+        return store.get(near) if near else None
+
+    def _set_many(self, items: List[Tuple[str, Any]]) -> None:
+        entries = []
+        for text, value in items:
+            text = normalise_text(text)
+            digest = make_key(self.namespace, text, self.salt)
+            entries.append((text, digest, self._adapter.dump_json(value).decode()))
+        get_store().set_many([(digest, value) for _, digest, value in entries])
+
+        index = get_semantic_index(self.namespace) if self.semantic else None
+        if index is not None:
+            try:
+                for text, digest, _ in entries:
+                    index.add(text, digest)
+            except Exception as e:
+                logger.warning(f"{self.namespace} semantic index update failed: {e}")
+
+
+def semantic_cached(
+    namespace: str,
+    key: Callable[..., str],
+    salt: str = "",
+    semantic: bool = True,
+):
+    """
+    Cache an async LLM call on disk via ResponseCache.
+
+    Exceptions are not cached, so wrapped functions should raise on failure.
+    Cache errors are logged and treated as a miss / skipped write.
+    """
+
+    def decorator(func: Callable[..., Any]):
+        cache = ResponseCache(
+            namespace, get_type_hints(func)["return"], salt=salt, semantic=semantic
+        )
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            text = key(*args, **kwargs)
+            try:
+                hit = await cache.get(text)
+            except Exception as e:
+                logger.warning(f"{namespace} cache lookup failed, treating as miss: {e}")
+                hit = None
+            if hit is not None:
+                return hit
+
+            result = await func(*args, **kwargs)
+            try:
+                await cache.set(text, result)
+            except Exception as e:
+                logger.warning(f"{namespace} cache write failed: {e}")
+            return result
+
+        return wrapper
+
+    return decorator
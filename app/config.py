@@ -1,5 +1,37 @@
+import os
+from typing import Dict, List, Tuple
+
+from dotenv import find_dotenv, load_dotenv
+
+# Load .env before any setting below is read
+load_dotenv(find_dotenv())
+
+# Write each sheet's final product DataFrame to ./data/products_<sheet>.parquet
+# (requires pyarrow from the dev extra: uv sync --extra dev)
+PARSER_DEBUG = bool(os.getenv("PARSER_DEBUG"))
+
 # LLM model
 EXTRACTION_MODEL = "gemini-3-flash-preview"
+# Retries (exponential backoff) on 429/5xx/connection errors per LLM call
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# Number of text records sent per extraction request
+LLM_BATCH_SIZE = 20
+# Concurrent extraction requests per sheet, and provider-wide requests per minute
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_RPM = int(os.getenv("LLM_RPM", "600"))
+
+# LLM response cache
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "./data/llm_cache")
+# Semantic (embedding) lookup is opt-in: needs the `cache` extra installed
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Semantic index inserts between writes to disk (pending inserts are flushed at shutdown)
+SEMANTIC_CACHE_PERSIST_EVERY = int(os.getenv("SEMANTIC_CACHE_PERSIST_EVERY", "100"))
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Skip the LLM header mapping when the heuristic leaves at most this many fields unmapped
+HEADER_MAPPING_MAX_MISSING = 2
 
 # Header Aliases
 HEADER_ALIASES = {
@@ -24,6 +56,18 @@ HEADER_ALIASES = {
     "product_details": ["details", "specifications", "specs", "remarks", "notes"],
 }
 
+# Lowercased aliases, built once for header matching
+HEADER_ALIASES_LOWER = {
+    canonical: [a.lower() for a in aliases]
+    for canonical, aliases in HEADER_ALIASES.items()
+}
+
+# alias -> [(canonical, priority)], lower priority wins for a canonical field
+EXACT_ALIAS_INDEX: Dict[str, List[Tuple[str, int]]] = {}
+for _canonical, _aliases in HEADER_ALIASES_LOWER.items():
+    for _rank, _alias in enumerate(_aliases):
+        EXACT_ALIAS_INDEX.setdefault(_alias, []).append((_canonical, _rank))
+
 # Prompts
 PRODUCT_EXTRACTION_PROMPT = """You are an expert extractor of structured product data from unstructured 
 architectural schedules. Always be deterministic, schema-faithful, and explicit when inferring 
@@ -32,7 +76,9 @@ missing values. Never include PII or contact details in fields not intended for
 
 # run_extraction.py
 PRODUCT_EXTRACTION_INSTRUCTIONS = """
-Populate every field in the Product schema from the provided text block.
+The input is a JSON array of records, each with an "id" and a "text" block.
+Populate every field in the Product schema from each record's text, returning exactly one product per record
+in the same order, with "id" copied from the input record. Never merge or skip records.
 
 CRITICAL RULES:
 1. BRAND: Extract ONLY the manufacturer name (e.g., 'Polytec'). Remove addresses, websites, phone numbers, and contact names.
@@ -47,20 +93,25 @@ If a value is missing: use empty string for text fields, 0 for numbers.
 
 EXAMPLE OUTPUT:
 {
-  "doc_code": "L1",
-  "product_name": "Minimalist Pendant Light",
-  "brand": "Lighting Co",
-  "colour": "Black",
-  "finish": "Brushed Brass",
-  "material": "Metal",
-  "width": 300,
-  "length": 300,
-  "height": 600,
-  "qty": 1,
-  "rrp": 489.0,
-  "feature_image": "blackpendantlight.jpg",
-  "product_description": "A simple pendant light ideal for modern interiors.",
-  "product_details": "Install at 2.4m height; supplied with dimmable bulb."
+  "products": [
+    {
+      "id": 0,
+      "doc_code": "L1",
+      "product_name": "Minimalist Pendant Light",
+      "brand": "Lighting Co",
+      "colour": "Black",
+      "finish": "Brushed Brass",
+      "material": "Metal",
+      "width": 300,
+      "length": 300,
+      "height": 600,
+      "qty": 1,
+      "rrp": 489.0,
+      "feature_image": "blackpendantlight.jpg",
+      "product_description": "A simple pendant light ideal for modern interiors.",
+      "product_details": "Install at 2.4m height; supplied with dimmable bulb."
+    }
+  ]
 }
 """
 
@@ -1,16 +1,31 @@
 import os
-from typing import List, Dict
+import json
+import asyncio
+import weakref
+from typing import List, Dict, Optional
 
-from dotenv import load_dotenv
+import httpx
+from aiolimiter import AsyncLimiter
 from pydantic_ai import Agent
+from pydantic_ai.exceptions import ModelHTTPError
 from pydantic_ai.models.google import GoogleModel
+from pydantic_ai.providers.google import GoogleProvider
 from pydantic_ai.settings import ModelSettings
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
 
 # import local modules
-from app.models import Product, HeaderMapping
+from app.models import Product, ProductBatch, HeaderMapping
 from app.logger import get_logger
+from app.cache import ResponseCache, semantic_cached
 from app.config import (
     EXTRACTION_MODEL,
+    LLM_MAX_RETRIES,
+    LLM_RPM,
     PRODUCT_EXTRACTION_PROMPT,
     PRODUCT_EXTRACTION_INSTRUCTIONS,
     HEADER_MAPPING_PROMPT,
@@ -18,44 +33,155 @@ from app.config import (
 
 # setup
 logger = get_logger(__name__)
-load_dotenv()
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
+# shared pooled HTTP/2 client so concurrent calls reuse warm connections
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    http2=True,
+    timeout=httpx.Timeout(60.0, connect=5.0),
+)
+model = GoogleModel(
+    model_name=EXTRACTION_MODEL,
+    provider=GoogleProvider(api_key=GEMINI_API_KEY, http_client=http_client),
+)
+
+# provider-wide request budget, shared by every sheet and agent
+_rate_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncLimiter]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_rate_limiter() -> AsyncLimiter:
+    """LLM_RPM limiter for the running event loop (a limiter can't span loops)."""
+    loop = asyncio.get_running_loop()
+    if loop not in _rate_limiters:
+        _rate_limiters[loop] = AsyncLimiter(max_rate=LLM_RPM, time_period=60)
+    return _rate_limiters[loop]
+
+
 # agents
 header_mapping_agent = Agent(
-    model=GoogleModel(model_name=EXTRACTION_MODEL),
+    model=model,
     output_type=HeaderMapping,
     model_settings=ModelSettings(temperature=0.2),
     instructions=HEADER_MAPPING_PROMPT,
 )
 
 extraction_agent = Agent(
-    model=GoogleModel(model_name=EXTRACTION_MODEL),
-    output_type=Product,
+    model=model,
+    output_type=ProductBatch,
     model_settings=ModelSettings(temperature=0.2),
     system_prompt=PRODUCT_EXTRACTION_PROMPT,
     instructions=PRODUCT_EXTRACTION_INSTRUCTIONS,
 )
 
 
+product_cache = ResponseCache(
+    namespace="product",
+    output_type=Product,
+    salt=EXTRACTION_MODEL + PRODUCT_EXTRACTION_PROMPT + PRODUCT_EXTRACTION_INSTRUCTIONS,
+)
+
+
 # functions
-async def extract_header_mapping(raw_headers: List[str]) -> Dict[str, str]:
-    """Uses LLM to map raw headers to canonical fields."""
-    try:
-        result = await header_mapping_agent.run(
-            f"Raw headers: {', '.join(raw_headers)}"
+def _is_transient(exc: BaseException) -> bool:
+    """Rate limits, server errors and connection failures are worth retrying."""
+    if isinstance(exc, ModelHTTPError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+llm_retry = retry(
+    retry=retry_if_exception(_is_transient),
+    wait=wait_exponential(multiplier=0.5, max=8),
+    stop=stop_after_attempt(LLM_MAX_RETRIES + 1),
+    reraise=True,
+)
+
+
+def _header_mapping_key(
+    raw_headers: List[str], fields: Optional[List[str]] = None
+) -> str:
+    headers = "|".join(sorted(str(h) for h in raw_headers))
+    return f"{headers}#{'|'.join(sorted(fields or []))}"
+
+
+@semantic_cached(
+    namespace="header_mapping",
+    key=_header_mapping_key,
+    salt=EXTRACTION_MODEL + HEADER_MAPPING_PROMPT,
+    semantic=False,
+)
+@llm_retry
+async def _run_header_mapping(
+    raw_headers: List[str], fields: Optional[List[str]] = None
+) -> Dict[str, str]:
+    prompt = f"Raw headers: {', '.join(raw_headers)}"
+    if fields:
+        prompt += f"\nOnly map these canonical fields: {', '.join(fields)}"
+    async with get_rate_limiter():
+        result = await header_mapping_agent.run(prompt)
+    return result.output.mapping
+
+
+@llm_retry
+async def _run_batch_extraction(texts: List[str]) -> List[Product]:
+    records = [{"id": i, "text": t} for i, t in enumerate(texts)]
+    async with get_rate_limiter():
+        result = await extraction_agent.run(
+            f"Extract from records:\n{json.dumps(records, ensure_ascii=False)}"
         )
-        return result.output.mapping
+    # Only trust the realignment if every record came back exactly once
+    ids = sorted(p.id for p in result.output.products)
+    if ids != list(range(len(texts))):
+        raise ValueError(f"Batch ids {ids} do not match records 0..{len(texts) - 1}")
+
+    by_id = {
+        p.id: Product.model_validate(p.model_dump(exclude={"id"}))
+        for p in result.output.products
+    }
+    return [by_id[i] for i in range(len(texts))]
+
+
+async def extract_header_mapping(
+    raw_headers: List[str], fields: Optional[List[str]] = None
+) -> Dict[str, str]:
+    """Uses LLM to map raw headers to canonical fields (optionally only `fields`)."""
+    try:
+        return await _run_header_mapping(raw_headers, fields)
     except Exception as e:
         logger.error(f"AI Header Mapping failed: {e}")
         return {}
 
 
-async def extract_product_details_ai(text: str) -> Product:
-    """Uses LLM to extract full structured Product data from text."""
+async def extract_products_batch_ai(texts: List[str]) -> List[Product]:
+    """Uses LLM to extract Products for many text blocks in a single request."""
+    try:
+        products = await product_cache.get_many(texts)
+    except Exception as e:
+        logger.warning(f"Product cache lookup failed, treating as miss: {e}")
+        products = [None] * len(texts)
+    misses = [i for i, p in enumerate(products) if p is None]
+    if not misses:
+        return products
+
+    try:
+        extracted = await _run_batch_extraction([texts[i] for i in misses])
+    except Exception as e:
+        logger.error(f"AI Batch Product Extraction failed: {e}")
+        extracted = [None] * len(misses)
+
+    fresh = []
+    for i, product in zip(misses, extracted):
+        if product is None:
+            product = Product()
+        else:
+            fresh.append((texts[i], product))
+        products[i] = product
+
     try:
-        result = await extraction_agent.run(f"Extract from: {text}")
-        return result.output
+        await product_cache.set_many(fresh)
     except Exception as e:
-        logger.error(f"AI Full Product Extraction failed: {e}")
-        return Product()
+        logger.warning(f"Product cache write failed: {e}")
+    return products
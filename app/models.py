@@ -31,6 +31,27 @@ class Product(BaseModel):
     product_details: str = Field(default="", description="Additional specifications")
 
 
+# Field groups by type, computed once for normalization
+PRODUCT_TEXT_FIELDS = tuple(
+    name
+    for name, f in Product.model_fields.items()
+    if f.annotation in (str, Optional[str])
+)
+PRODUCT_NUMERIC_FIELDS = tuple(
+    name for name, f in Product.model_fields.items() if f.annotation in (int, float)
+)
+
+
+class BatchProduct(Product):
+    id: int = Field(description="Id of the input record this product was extracted from")
+
+
+class ProductBatch(BaseModel):
+    products: List[BatchProduct] = Field(
+        description="One extracted product per input record, in input order"
+    )
+
+
 class ProductSchedule(BaseModel):
     schedule_name: str
     products: List[Product]
@@ -2,16 +2,93 @@
 
 import re
 import asyncio
+from datetime import date, datetime
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any
-
-from app.config import HEADER_ALIASES
-from app.models import Product
+from typing import List, Dict, Any, IO
+from pydantic import TypeAdapter, ValidationError
+from python_calamine import CalamineWorkbook, CalamineSheet, SheetTypeEnum
+
+from app.config import (
+    EXACT_ALIAS_INDEX,
+    HEADER_ALIASES_LOWER,
+    HEADER_MAPPING_MAX_MISSING,
+    LLM_BATCH_SIZE,
+    LLM_MAX_CONCURRENCY,
+    PARSER_DEBUG,
+)
+from app.models import Product, PRODUCT_TEXT_FIELDS
 from app.logger import get_logger
-from app.llm import extract_header_mapping, extract_product_details_ai
+from app.llm import extract_header_mapping, extract_products_batch_ai
 
 logger = get_logger(__name__)
 
+_NUM_RE = re.compile(r"(\d+(?:\.\d+)?)")
+_METRE_RE = re.compile(r"\bM\b")
+
+_PRODUCT_LIST_ADAPTER = TypeAdapter(List[Product])
+
+# Cell strings pandas' read_excel treats as missing by default
+_NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null",
+}  # fmt: skip
+
+
+# Ingestion
+def _convert_cell(value: Any) -> Any:
+    """Match pandas' calamine conversion: blanks to None, whole floats to int."""
+    if isinstance(value, str):
+        return None if value in _NA_STRINGS else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+def _read_sheet_from_header(sheet: CalamineSheet, threshold: float) -> pd.DataFrame:
+    """Stream rows until the first dense (header) row, then materialise the rest."""
+    # Pad for empty leading columns so density matches a full read from A1
+    _, start_col = sheet.start or (0, 0)
+    width = start_col + sheet.width
+    if sheet.width == 0:
+        return pd.DataFrame()
+    pad = [None] * start_col
+
+    rows = []
+    for raw in sheet.iter_rows():
+        row = pad + [_convert_cell(v) for v in raw]
+        if not rows and sum(v is not None for v in row) / width < threshold:
+            continue
+        rows.append(row)
+
+    return pd.DataFrame(rows).infer_objects()
+
+
+def read_excel_from_header(
+    source: str | IO[bytes], threshold: float = 0.7
+) -> Dict[str, pd.DataFrame]:
+    """
+    Read every worksheet, skipping preamble rows above the header.
+
+    Each DataFrame starts at the first row meeting find_header_row's density
+    threshold (header=None), so preamble rows are never allocated.
+    """
+    if isinstance(source, str):
+        workbook = CalamineWorkbook.from_path(source)
+    else:
+        workbook = CalamineWorkbook.from_filelike(source)
+
+    sheets = {}
+    for meta in workbook.sheets_metadata:
+        if meta.typ != SheetTypeEnum.WorkSheet:
+            continue
+        sheet = workbook.get_sheet_by_name(meta.name)
+        sheets[meta.name] = _read_sheet_from_header(sheet, threshold)
+    return sheets
+
 
 # Header Detection
 def make_unique(headers: List[str]) -> List[str]:
@@ -52,28 +129,32 @@ def find_header_row(df: pd.DataFrame, threshold: float = 0.7) -> int | None:
 
 def normalise_headers(df: pd.DataFrame) -> Dict[str, str]:
     """Map raw headers to canonical Product fields using stable heuristic."""
-    mapping = {}
     cols = [str(c).strip().lower() for c in df.columns]
 
-    # Pass 1: Exact matches
-    for canonical, aliases in HEADER_ALIASES.items():
-        for alias in aliases:
-            if alias.lower() in cols:
-                idx = cols.index(alias.lower())
-                mapping[canonical] = df.columns[idx]
-                break
+    # Pass 1: Exact matches (alias priority first, then column order)
+    best = {}
+    for idx, c in enumerate(cols):
+        for canonical, rank in EXACT_ALIAS_INDEX.get(c, ()):
+            if canonical not in best or rank < best[canonical][0]:
+                best[canonical] = (rank, idx)
+    mapping = {
+        canonical: df.columns[best[canonical][1]]
+        for canonical in HEADER_ALIASES_LOWER
+        if canonical in best
+    }
 
     # Pass 2: Substring matches (min 3 chars)
-    for col in df.columns:
-        c = str(col).strip().lower()
-        if any(c == str(v).lower() for v in mapping.values()):
+    mapped = {str(v).lower() for v in mapping.values()}
+    for col, c in zip(df.columns, cols):
+        if c in mapped:
             continue
 
-        for canonical, aliases in HEADER_ALIASES.items():
+        for canonical, aliases in HEADER_ALIASES_LOWER.items():
             if canonical in mapping:
                 continue
-            if any(len(a) >= 3 and a.lower() in c for a in aliases):
+            if any(len(a) >= 3 and a in c for a in aliases):
                 mapping[canonical] = col
+                mapped.add(str(col).lower())
                 break
 
     logger.info(f"Heuristic mapping: matched {len(mapping)} fields")
@@ -83,25 +164,92 @@ def normalise_headers(df: pd.DataFrame) -> Dict[str, str]:
 def prepare_data_frame(df: pd.DataFrame, header_row_idx: int) -> pd.DataFrame:
     """Extract data rows and filter out completely empty rows."""
     headers = make_unique(df.iloc[header_row_idx].tolist())
-    df_data = df.iloc[header_row_idx + 1 :].copy()
+    # Slice is a view; the row filter below is the only copy made
+    df_data = df.iloc[header_row_idx + 1 :]
     # Lower threshold to keep sparse vertical rows (brand, desc rows)
-    df_data = df_data[df_data.notnull().any(axis=1)]
+    mask = df_data.notnull().to_numpy().any(axis=1)
+    df_data = df_data.iloc[mask]
     df_data.columns = headers
     return df_data.reset_index(drop=True)
 
 
+# Grouping
+def aggregate_groups(df: pd.DataFrame, group_col: str) -> pd.DataFrame:
+    """
+    Collapse contiguous row groups into one row each.
+
+    Text columns are newline-joined (stripped, nulls dropped); other
+    columns take the first non-null value. Rows sharing a key must be adjacent.
+    """
+    keys = df[group_col].to_numpy()
+    if len(keys) == 0:
+        return df.drop(columns=group_col)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    bounds = list(zip(starts, np.r_[starts[1:], len(keys)]))
+
+    columns = [c for c in df.columns if c != group_col]
+    text_cols = [
+        c
+        for c in columns
+        if df[c].dtype == "object" or pd.api.types.is_string_dtype(df[c].dtype)
+    ]
+    other_cols = [c for c in columns if c not in text_cols]
+
+    result = df.groupby(group_col, sort=False)[other_cols].first()
+    result = result.reindex(pd.Index(keys[starts], name=group_col))
+    for col in text_cols:
+        values = [
+            None if missing else str(v).strip()
+            for v, missing in zip(df[col].to_numpy(), df[col].isna().to_numpy())
+        ]
+        result[col] = [
+            "\n".join([v for v in values[start:end] if v is not None]).strip()
+            for start, end in bounds
+        ]
+
+    return result[columns]
+
+
 # Data Enrichment
 async def _extract_batch(unique_texts: List[str]) -> Dict[str, Dict[str, Any]]:
-    """Extract product data from unique text blocks with concurrency control."""
-    semaphore = asyncio.Semaphore(5)
+    """Extract product data from unique text blocks in batched requests with concurrency control."""
+    semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    shards = [
+        unique_texts[i : i + LLM_BATCH_SIZE]
+        for i in range(0, len(unique_texts), LLM_BATCH_SIZE)
+    ]
 
-    async def extract_with_semaphore(text: str):
+    async def extract_with_semaphore(shard: List[str]):
         async with semaphore:
-            specs = await extract_product_details_ai(text)
-            return text, specs.model_dump(exclude_none=True)
-
-    results = await asyncio.gather(*[extract_with_semaphore(t) for t in unique_texts])
-    return dict(results)
+            products = await extract_products_batch_ai(shard)
+            return [
+                (text, specs.model_dump(exclude_none=True))
+                for text, specs in zip(shard, products)
+            ]
+
+    results = await asyncio.gather(*[extract_with_semaphore(s) for s in shards])
+    return {text: specs for shard in results for text, specs in shard}
+
+
+def _join_labelled(df: pd.DataFrame, cols: List[str]) -> pd.Series:
+    """Join each row's non-empty cells as "col: value" lines, built column-wise."""
+    if not cols:
+        return pd.Series("", index=df.index, dtype=object)
+
+    parts = []
+    for col in cols:
+        s = df[col]
+        if not (s.dtype == "object" or pd.api.types.is_string_dtype(s.dtype)):
+            # Keep str() formatting for typed columns (e.g. datetime64 keeps its time)
+            s = s.map(str, na_action="ignore")
+        s = s.astype("string").fillna("")
+        parts.append(np.where(s.str.strip().ne(""), f"{col}: " + s, ""))
+
+    return pd.Series(
+        ["\n".join(p for p in row if p) for row in zip(*parts)],
+        index=df.index,
+        dtype=object,
+    )
 
 
 def _merge_extracted_data(
@@ -130,18 +278,9 @@ def _merge_extracted_data(
 async def extract_product_data(df: pd.DataFrame) -> pd.DataFrame:
     """Extract and fill product data from text fields (batched and deduplicated)."""
     # Combine text sources with labels for better extraction context
-    search_text = (
-        df[["product_name", "product_description", "product_details", "brand"]]
-        .apply(
-            lambda row: "\n".join(
-                f"{col}: {val}"
-                for col, val in row.items()
-                if pd.notna(val) and str(val).strip()
-            ),
-            axis=1,
-        )
-        .str.strip()
-    )
+    search_text = _join_labelled(
+        df, ["product_name", "product_description", "product_details", "brand"]
+    ).str.strip()
 
     unique_texts = search_text[search_text != ""].unique().tolist()
     if not unique_texts:
@@ -170,40 +309,67 @@ def clean_numeric_string(value: Any) -> int:
         return 0
 
     s = str(value).strip().upper()
-    match = re.search(r"(\d+(?:\.\d+)?)", s)
+    match = _NUM_RE.search(s)
     if not match:
         return 0
 
     num = float(match.group(1))
 
     # Convert metres to mm
-    if "METRE" in s or (re.search(r"\bM\b", s) and "MM" not in s):
+    if "METRE" in s or (_METRE_RE.search(s) and "MM" not in s):
         return int(num * 1000)
 
     return int(num)
 
 
+def clean_numeric_series(series: pd.Series) -> pd.Series:
+    """Vectorised clean_numeric_string for a whole column."""
+    s = series.fillna("").astype(str).str.strip().str.upper()
+    nums = s.str.extract(_NUM_RE, expand=False).astype(float).fillna(0)
+
+    # Convert metres to mm
+    is_metre = s.str.contains("METRE", regex=False) | (
+        s.str.contains(_METRE_RE) & ~s.str.contains("MM", regex=False)
+    )
+    values = np.where(is_metre, nums * 1000, nums)
+
+    # Values beyond int64 fall back to the scalar path (Python ints don't overflow)
+    in_range = values < 2**63
+    result = pd.Series(
+        np.where(in_range, values, 0).astype(np.int64), index=series.index
+    )
+    if not in_range.all():
+        result = result.astype(object)
+        result[~in_range] = series[~in_range].map(clean_numeric_string)
+    return result
+
+
+def _clean_text_column(series: pd.Series, upper: bool) -> List[str]:
+    """Fill missing, strip, blank out "nan" and optionally uppercase in one pass."""
+    cleaned = []
+    for value, missing in zip(series.to_numpy(dtype=object), series.isna().to_numpy()):
+        s = "" if missing else str(value).strip()
+        if s == "nan":
+            s = ""
+        cleaned.append(s.upper() if upper else s)
+    return cleaned
+
+
 def normalize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     """Final cleaning: strip text, normalize dimensions, clean currency/qty."""
     # Text fields
-    text_cols = [
-        f for f, t in Product.model_fields.items() if "str" in str(t.annotation).lower()
-    ]
     # Fields to keep in original case
     preserve_case = ["product_description", "product_details", "feature_image"]
 
-    for col in text_cols:
+    for col in PRODUCT_TEXT_FIELDS:
         if col in df.columns:
-            df[col] = df[col].fillna("").astype(str).str.strip()
-            df[col] = df[col].replace("nan", "", regex=False)
             # Uppercase all text fields except descriptions and details
-            if col not in preserve_case:
-                df[col] = df[col].str.upper()
+            df[col] = _clean_text_column(df[col], upper=col not in preserve_case)
 
     # Dimensions
     for dim in ["width", "height", "length"]:
         if dim in df.columns:
-            df[dim] = df[dim].apply(clean_numeric_string)
+            df[dim] = clean_numeric_series(df[dim])
 
     # Currency
     if "rrp" in df.columns:
@@ -236,6 +402,54 @@ def is_meaningful(row: Dict[str, Any]) -> bool:
     return has_identity or attr_count >= 2
 
 
+def meaningful_mask(df: pd.DataFrame) -> pd.Series:
+    """Vectorised is_meaningful over every row; missing cells count as empty."""
+
+    def non_empty(field: str) -> pd.Series:
+        if field not in df.columns:
+            return pd.Series(False, index=df.index)
+        return df[field].fillna("").astype(str).str.strip().ne("")
+
+    # 1. doc_code sanity
+    code = (
+        df["doc_code"].fillna("").astype(str).str.strip()
+        if "doc_code" in df.columns
+        else pd.Series("", index=df.index)
+    )
+    code_ok = code.ne("") & ~code.str.lower().isin(["nan", "none", "*", "-", "."])
+
+    # 2. Content check: must have identity (name/brand/desc) OR multiple attributes
+    id_fields = ["product_name", "brand", "product_description"]
+    attr_fields = ["colour", "finish", "material", "product_details"]
+
+    has_identity = pd.concat([non_empty(f) for f in id_fields], axis=1).any(axis=1)
+    attr_count = sum(non_empty(f).astype(int) for f in attr_fields)
+
+    return code_ok & (has_identity | (attr_count >= 2))
+
+
+def validate_products(records: List[Dict[str, Any]]) -> List[Product]:
+    """Validate records as one list, dropping (and logging) only the invalid rows."""
+    try:
+        return _PRODUCT_LIST_ADAPTER.validate_python(records)
+    except ValidationError as e:
+        errors: Dict[int, List[str]] = {}
+        for err in e.errors():
+            idx, *field = err["loc"]
+            errors.setdefault(idx, []).append(
+                f"{'.'.join(map(str, field))}: {err['msg']}"
+            )
+
+    for idx, messages in errors.items():
+        logger.warning(
+            f"Validation failed for product {records[idx].get('doc_code')}: "
+            + "; ".join(messages)
+        )
+    return _PRODUCT_LIST_ADAPTER.validate_python(
+        [r for i, r in enumerate(records) if i not in errors]
+    )
+
+
 # Main Pipeline
 async def extract_products_from_sheet(
     df: pd.DataFrame, sheet_name: str
@@ -258,17 +472,21 @@ async def extract_products_from_sheet(
 
     # 3. Map headers (heuristic + automated)
     mapping = normalise_headers(df_data)
-    try:
-        auto_map = await extract_header_mapping(list(df_data.columns))
-        mapping.update(
-            {
-                k: v
-                for k, v in auto_map.items()
-                if k not in mapping and v in df_data.columns
-            }
-        )
-    except Exception as e:
-        logger.warning(f"Automated header mapping failed: {e}")
+    missing = sorted(set(Product.model_fields) - set(mapping) - {"feature_image"})
+    if len(missing) > HEADER_MAPPING_MAX_MISSING:
+        try:
+            auto_map = await extract_header_mapping(list(df_data.columns), missing)
+            mapping.update(
+                {
+                    k: v
+                    for k, v in auto_map.items()
+                    if k not in mapping and v in df_data.columns
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Automated header mapping failed: {e}")
+    else:
+        logger.info(f"Skipping automated header mapping, unmapped fields: {missing}")
 
     logger.info(f"Final mapping: {mapping}")
     logger.info(f"Total mapped fields: {len(mapping)}")
@@ -285,19 +503,8 @@ async def extract_products_from_sheet(
     logger.info(f"Grouped data into {num_groups} products")
 
     # 5. Aggregate multi-row products
-    agg_logic = {
-        c: (
-            (lambda x: "\n".join(x.dropna().astype(str).str.strip()).strip())
-            if df_data[c].dtype == "object"
-            else "first"
-        )
-        for c in df_data.columns
-        if c != "group_id"
-    }
-    product_df = (
-        df_data.groupby("group_id")
-        .agg(agg_logic)
-        .rename(columns={v: k for k, v in mapping.items()})
+    product_df = aggregate_groups(df_data, "group_id").rename(
+        columns={v: k for k, v in mapping.items()}
     )
 
     # 6. Catch-all for unmapped columns
@@ -305,12 +512,7 @@ async def extract_products_from_sheet(
         c for c in product_df.columns if c not in Product.model_fields and c != doc_col
     ]
     if unmapped:
-        product_df["product_details"] = product_df[unmapped].apply(
-            lambda r: "\n".join(
-                f"{c}: {v}" for c, v in r.items() if pd.notna(v) and str(v).strip()
-            ),
-            axis=1,
-        )
+        product_df["product_details"] = _join_labelled(product_df, unmapped)
 
     # 7. Extract & normalize product data
     product_df = product_df.reindex(columns=list(Product.model_fields.keys()))
@@ -320,20 +522,21 @@ async def extract_products_from_sheet(
     logger.info("Product data extraction and normalization complete")
 
     # 8. Apply filtering
-    mask = product_df.apply(is_meaningful, axis=1)
+    mask = meaningful_mask(product_df)
     product_df = product_df[mask].reset_index(drop=True)
     logger.info(f"Filtered to {len(product_df)} meaningful products")
 
-    # Save dataframe for debugging
-    product_df.to_csv("./data/products_df.csv", index=False)
-
-    # 9. Validate and return products
-    products = []
-    for r in product_df.to_dict("records"):
+    # Save dataframe for debugging (off the event loop)
+    if PARSER_DEBUG:
         try:
-            products.append(Product.model_validate(r))
+            await asyncio.to_thread(
+                product_df.to_parquet, f"./data/products_{sheet_name}.parquet"
+            )
         except Exception as e:
-            logger.warning(f"Validation failed for product {r.get('doc_code')}: {e}")
+            logger.warning(f"Failed to save debug dataframe for '{sheet_name}': {e}")
+
+    # 9. Validate and return products
+    products = validate_products(product_df.to_dict("records"))
 
     logger.info(
         f"Successfully extracted {len(products)} products from sheet '{sheet_name}'"
@@ -345,14 +548,13 @@ if __name__ == "__main__":
     # used mainly for testing and debugging
     async def main():
         excel_file = "./data/schedule_sample1.xlsx"
-        xls = pd.ExcelFile(excel_file)
+        all_sheets = read_excel_from_header(excel_file)
 
         total_products = 0
-        for sheet_name in xls.sheet_names:
+        for sheet_name, df in all_sheets.items():
             try:
                 logger.info(f"Extracting products from sheet: {sheet_name}")
-                df = pd.read_excel(io=excel_file, sheet_name=sheet_name)
-                products, warnings = await extract_products_from_sheet(
+                products = await extract_products_from_sheet(
                     df=df, sheet_name=sheet_name
                 )
                 total_products += len(products)
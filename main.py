@@ -1,21 +1,40 @@
 import io
+import asyncio
 import uvicorn
 import pandas as pd
 from typing import List
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
 # import local modules
 from app.models import ProductSchedule
-from app.parser import extract_products_from_sheet
+from app.parser import extract_products_from_sheet, read_excel_from_header
 from app.logger import get_logger
+from app.llm import http_client
+from app.cache import flush_semantic_cache, prewarm_semantic_cache
 
 # init logger
 logger = get_logger(__name__)
 
+# Copy-on-Write lets slices stay views until modified (always on from pandas 3)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+
+# Startup: prewarm shared resources
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the embedding model once so the first /parse call isn't slowed down
+    await asyncio.to_thread(prewarm_semantic_cache)
+    yield
+    await asyncio.to_thread(flush_semantic_cache)
+    await http_client.aclose()
+
+
 # FastAPI App
-app = FastAPI(title="Excel Schedule Parser", version="1.0.0")
+app = FastAPI(title="Excel Schedule Parser", version="1.0.0", lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -45,25 +64,31 @@ async def parse_excel(file: UploadFile = File(...)):
         content = await file.read()
         excel_file = io.BytesIO(content)
 
-        # Read all sheets
-        xls = pd.ExcelFile(excel_file)
-        schedules = []
+        # Read all sheets in a single pass, skipping preamble rows above the header
+        all_sheets = read_excel_from_header(excel_file)
+        sheet_names = list(all_sheets.keys())
+        tasks = [
+            extract_products_from_sheet(df, sheet_name)
+            for sheet_name, df in all_sheets.items()
+        ]
+
+        # Sheets are independent, so overlap their LLM calls
+        results = await asyncio.gather(*tasks, return_exceptions=True)
 
-        for sheet_name in xls.sheet_names:
-            try:
-                df = pd.read_excel(excel_file, sheet_name=sheet_name, header=None)
-                products = await extract_products_from_sheet(df, sheet_name)
-                
-                # Create a ProductSchedule for each sheet
-                schedules.append(
-                    ProductSchedule(
-                        schedule_name=sheet_name,
-                        products=products,
-                    )
+        schedules = []
+        for sheet_name, products in zip(sheet_names, results):
+            if isinstance(products, Exception):
+                logger.error(f"Sheet '{sheet_name}' processing error: {products}")
+                continue
+
+            # Create a ProductSchedule for each sheet
+            schedules.append(
+                ProductSchedule(
+                    schedule_name=sheet_name,
+                    products=products,
                 )
-                logger.info(f"Processed sheet '{sheet_name}': {len(products)} products")
-            except Exception as e:
-                logger.error(f"Sheet '{sheet_name}' processing error: {e}")
+            )
+            logger.info(f"Processed sheet '{sheet_name}': {len(products)} products")
 
         logger.info(f"Successfully processed {len(schedules)} sheets from '{file.filename}'")
         return schedules
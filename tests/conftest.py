@@ -1,12 +1,42 @@
 import io
+import json
+from types import SimpleNamespace
 import pandas as pd
 import pytest
 from fastapi.testclient import TestClient
 from main import app
+from app import cache, llm
+from app.models import BatchProduct, HeaderMapping, ProductBatch
+
+
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(tmp_path, monkeypatch):
+    """Keep the on-disk LLM cache out of the working tree during tests"""
+    get_store = cache.get_store
+    monkeypatch.setattr(cache, "LLM_CACHE_DIR", str(tmp_path / "llm_cache"))
+    get_store.cache_clear()
+    yield
+    get_store.cache_clear()
+
+
+class FakeHeaderMappingAgent:
+    async def run(self, prompt):
+        return SimpleNamespace(output=HeaderMapping(mapping={}))
+
+
+class FakeExtractionAgent:
+    """Echo each record back as a product so no real LLM calls are made"""
+
+    async def run(self, prompt):
+        records = json.loads(prompt.split("\n", 1)[1])
+        products = [BatchProduct(id=r["id"]) for r in records]
+        return SimpleNamespace(output=ProductBatch(products=products))
 
 
 @pytest.fixture
-def client():
+def client(monkeypatch):
+    monkeypatch.setattr(llm, "header_mapping_agent", FakeHeaderMappingAgent())
+    monkeypatch.setattr(llm, "extraction_agent", FakeExtractionAgent())
     return TestClient(app)
 
 
@@ -0,0 +1,198 @@
+import pickle
+import sqlite3
+import sys
+import types
+import numpy as np
+import pytest
+from app import cache
+from app.cache import (
+    ExactCache,
+    ResponseCache,
+    SemanticIndex,
+    make_key,
+    prewarm_semantic_cache,
+    semantic_cached,
+)
+from app.models import Product
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ExactCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(cache, "get_store", lambda: store)
+    return store
+
+
+def test_make_key_normalises_whitespace():
+    assert make_key("product", "Chair  \n Oak") == make_key("product", "Chair Oak")
+    assert make_key("product", "Chair") != make_key("header_mapping", "Chair")
+    assert make_key("product", "Chair", salt="v1") != make_key("product", "Chair")
+
+
+def test_exact_cache_roundtrip(store):
+    assert store.get("missing") is None
+    store.set("k", "v")
+    assert store.get("k") == "v"
+
+
+@pytest.mark.asyncio
+async def test_response_cache_batches_roundtrip(store):
+    product_cache = ResponseCache("product", Product, semantic=False)
+    await product_cache.set_many(
+        [("Chair", Product(doc_code="F64")), ("Desk", Product(doc_code="F65"))]
+    )
+    hits = await product_cache.get_many(["Desk", "Table", " Chair "])
+    assert [h.doc_code if h else None for h in hits] == ["F65", None, "F64"]
+
+
+@pytest.mark.asyncio
+async def test_semantic_cached_skips_repeat_calls(store):
+    calls = []
+
+    @semantic_cached(namespace="product", key=lambda text: text, semantic=False)
+    async def extract(text: str) -> Product:
+        calls.append(text)
+        return Product(doc_code="F64", product_name=text)
+
+    first = await extract("Study Chair")
+    second = await extract("Study  Chair")
+    assert first == second
+    assert isinstance(second, Product)
+    assert calls == ["Study Chair"]
+
+
+@pytest.mark.asyncio
+async def test_semantic_cached_does_not_cache_errors(store):
+    calls = []
+
+    @semantic_cached(namespace="product", key=lambda text: text, semantic=False)
+    async def extract(text: str) -> Product:
+        calls.append(text)
+        raise RuntimeError("LLM unavailable")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await extract("Chair")
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_semantic_cached_falls_through_on_cache_error(monkeypatch):
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache, "get_store", locked)
+
+    @semantic_cached(namespace="product", key=lambda text: text, semantic=False)
+    async def extract(text: str) -> Product:
+        return Product(product_name=text)
+
+    assert (await extract("Chair")).product_name == "Chair"
+
+
+class _FakeIndex:
+    def __init__(self, d):
+        self.d, self.vectors = d, []
+
+    @property
+    def ntotal(self):
+        return len(self.vectors)
+
+    def add(self, vecs):
+        self.vectors.extend(vecs.tolist())
+
+    def search(self, vec, k):
+        scores = [sum(a * b for a, b in zip(v, vec[0])) for v in self.vectors]
+        best = max(range(len(scores)), key=scores.__getitem__)
+        return [[scores[best]]], [[best]]
+
+
+class _FakeFaiss(types.ModuleType):
+    IndexFlatIP = _FakeIndex
+
+    @staticmethod
+    def write_index(index, path):
+        with open(path, "wb") as f:
+            pickle.dump(index, f)
+
+    @staticmethod
+    def read_index(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+class _FakeEmbedModel:
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def encode(self, texts, **kwargs):
+        return np.array([[1.0, 0.0] if "chair" in t else [0.0, 1.0] for t in texts])
+
+
+@pytest.fixture
+def fake_semantic(monkeypatch):
+    monkeypatch.setitem(sys.modules, "faiss", _FakeFaiss("faiss"))
+    monkeypatch.setattr(cache, "get_embed_model", lambda: _FakeEmbedModel())
+
+
+def test_semantic_index_persists_in_batches(tmp_path, fake_semantic):
+    index = SemanticIndex(str(tmp_path), "product", 0.95, persist_every=2)
+    index.add("oak chair", "k1")
+    assert not (tmp_path / "product.faiss").exists()
+    index.add("pine table", "k2")
+    assert (tmp_path / "product.keys").read_text().split() == ["k1", "k2"]
+
+    index.add("teak chair", "k3")
+    index.flush()
+    reloaded = SemanticIndex(str(tmp_path), "product", 0.95)
+    assert reloaded.search("walnut table") == "k2"
+
+
+def test_semantic_index_discards_out_of_sync_files(tmp_path, fake_semantic):
+    index = SemanticIndex(str(tmp_path), "product", 0.95, persist_every=1)
+    index.add("oak chair", "k1")
+    with open(tmp_path / "product.keys", "a") as f:
+        f.write("stray\n")
+
+    reloaded = SemanticIndex(str(tmp_path), "product", 0.95)
+    assert reloaded.search("oak chair") is None
+
+
+@pytest.fixture
+def unloadable_model(monkeypatch):
+    calls = []
+
+    def load():
+        calls.append(1)
+        raise OSError("can't download all-MiniLM-L6-v2")
+
+    monkeypatch.setitem(sys.modules, "faiss", _FakeFaiss("faiss"))
+    monkeypatch.setattr(cache, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(cache, "_semantic_indexes", {})
+    monkeypatch.setattr(cache, "get_embed_model", load)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_semantic_load_failure_keeps_exact_hits(store, unloadable_model):
+    product_cache = ResponseCache("product", Product)
+    await product_cache.set_many([("Chair", Product(doc_code="F64"))])
+
+    for _ in range(2):
+        hits = await product_cache.get_many(["Chair", "Desk"])
+        assert [h.doc_code if h else None for h in hits] == ["F64", None]
+    assert len(unloadable_model) == 1
+
+
+def test_prewarm_survives_model_failures(unloadable_model, monkeypatch):
+    monkeypatch.setattr(cache, "LLM_CACHE_ENABLED", True)
+    prewarm_semantic_cache()
+    assert len(unloadable_model) == 1
+
+    class BrokenEncoder(_FakeEmbedModel):
+        def encode(self, texts, **kwargs):
+            raise OSError("model weights missing")
+
+    monkeypatch.setattr(cache, "_semantic_indexes", {"product": object()})
+    monkeypatch.setattr(cache, "get_embed_model", lambda: BrokenEncoder())
+    prewarm_semantic_cache()
@@ -0,0 +1,24 @@
+import importlib
+import os
+import dotenv
+from app import config
+
+
+def test_dotenv_values_reach_settings(tmp_path, monkeypatch):
+    env_file = tmp_path / ".env"
+    env_file.write_text("LLM_MAX_CONCURRENCY=7\nLLM_RPM=42\nLLM_CACHE_ENABLED=0\n")
+    monkeypatch.setattr(dotenv, "find_dotenv", lambda *args, **kwargs: str(env_file))
+    for key in ("LLM_MAX_CONCURRENCY", "LLM_RPM", "LLM_CACHE_ENABLED"):
+        monkeypatch.delenv(key, raising=False)
+
+    try:
+        importlib.reload(config)
+        assert config.LLM_MAX_CONCURRENCY == 7
+        assert config.LLM_RPM == 42
+        assert config.LLM_CACHE_ENABLED is False
+    finally:
+        # load_dotenv writes os.environ directly, so undo it before restoring
+        for key in ("LLM_MAX_CONCURRENCY", "LLM_RPM", "LLM_CACHE_ENABLED"):
+            os.environ.pop(key, None)
+        monkeypatch.undo()
+        importlib.reload(config)
@@ -0,0 +1,64 @@
+import sqlite3
+from types import SimpleNamespace
+import httpx
+import pytest
+from pydantic_ai.exceptions import ModelHTTPError
+from app import cache, llm
+from app.models import BatchProduct, Product, ProductBatch
+
+
+@pytest.fixture
+def broken_cache(monkeypatch):
+    def locked():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache, "get_store", locked)
+
+
+@pytest.mark.asyncio
+async def test_batch_extraction_survives_cache_failure(broken_cache, monkeypatch):
+    async def fake_run(texts):
+        return [Product(product_name=t) for t in texts]
+
+    monkeypatch.setattr(llm, "_run_batch_extraction", fake_run)
+    products = await llm.extract_products_batch_ai(["Chair", "Desk"])
+    assert [p.product_name for p in products] == ["Chair", "Desk"]
+
+
+@pytest.mark.parametrize("ids", [[1, 2], [0, 0], [0]])
+@pytest.mark.asyncio
+async def test_batch_extraction_rejects_misnumbered_ids(ids, monkeypatch):
+    class FakeAgent:
+        async def run(self, prompt):
+            products = [BatchProduct(id=i, product_name=f"P{i}") for i in ids]
+            return SimpleNamespace(output=ProductBatch(products=products))
+
+    monkeypatch.setattr(llm, "extraction_agent", FakeAgent())
+    texts = ["Chair", "Desk"]
+    products = await llm.extract_products_batch_ai(texts)
+    assert products == [Product(), Product()]
+    assert await llm.product_cache.get_many(texts) == [None, None]
+
+
+@pytest.mark.parametrize(
+    "exc, expected",
+    [
+        (ModelHTTPError(429, "gemini"), True),
+        (ModelHTTPError(500, "gemini"), True),
+        (ModelHTTPError(503, "gemini"), True),
+        (ModelHTTPError(400, "gemini"), False),
+        (ModelHTTPError(404, "gemini"), False),
+        (httpx.ConnectError("connection refused"), True),
+        (httpx.ReadTimeout("timed out"), True),
+        (ValueError("bad batch ids"), False),
+    ],
+)
+def test_is_transient(exc, expected):
+    assert llm._is_transient(exc) is expected
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_shared_within_loop():
+    limiter = llm.get_rate_limiter()
+    assert llm.get_rate_limiter() is limiter
+    assert limiter.max_rate == llm.LLM_RPM
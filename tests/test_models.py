@@ -1,6 +1,12 @@
 import pytest
 from pydantic import ValidationError
-from app.models import Product, ProductSchedule, HeaderMapping
+from app.models import (
+    Product,
+    ProductSchedule,
+    HeaderMapping,
+    PRODUCT_TEXT_FIELDS,
+    PRODUCT_NUMERIC_FIELDS,
+)
 
 
 def test_product_with_defaults():
@@ -69,3 +75,12 @@ def test_header_mapping_model():
 def test_invalid_product_type():
     with pytest.raises(ValidationError):
         Product(width="not_a_number")
+
+
+def test_product_field_groups():
+    assert "feature_image" in PRODUCT_TEXT_FIELDS
+    assert "doc_code" in PRODUCT_TEXT_FIELDS
+    assert PRODUCT_NUMERIC_FIELDS == ("width", "length", "height", "qty", "rrp")
+    assert set(PRODUCT_TEXT_FIELDS) | set(PRODUCT_NUMERIC_FIELDS) == set(
+        Product.model_fields
+    )
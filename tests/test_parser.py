@@ -1,14 +1,25 @@
+import io
+import asyncio
 import pytest
 import pandas as pd
 import numpy as np
+from app import parser
+from app.models import Product
 from app.parser import (
     make_unique,
     find_header_row,
     normalise_headers,
     clean_numeric_string,
+    clean_numeric_series,
     normalize_dataframe,
     prepare_data_frame,
+    read_excel_from_header,
+    aggregate_groups,
     is_meaningful,
+    meaningful_mask,
+    validate_products,
+    _extract_batch,
+    _join_labelled,
 )
 
 
@@ -30,6 +41,26 @@ def test_find_header_row():
     assert find_header_row(df, threshold=0.8) is None
 
 
+def test_read_excel_from_header_skips_preamble():
+    buffer = io.BytesIO()
+    pd.DataFrame(
+        [
+            ["Project: Example", np.nan, np.nan],
+            [np.nan, np.nan, np.nan],
+            ["code", "item", "qty"],
+            ["F64", "Chair", 4],
+        ]
+    ).to_excel(buffer, index=False, header=False, sheet_name="Sheet1")
+    buffer.seek(0)
+
+    sheets = read_excel_from_header(buffer)
+    df = sheets["Sheet1"]
+    assert list(sheets) == ["Sheet1"]
+    assert df.iloc[0].tolist() == ["code", "item", "qty"]
+    assert df.iloc[1].tolist() == ["F64", "Chair", 4]
+    assert find_header_row(df) == 0
+
+
 def test_normalise_headers_logic():
     # Pass 1: Exact matches (priority)
     df1 = pd.DataFrame({"doc_code": [1], "w": [1]})
@@ -56,6 +87,15 @@ def test_clean_numeric_string():
     assert clean_numeric_string("TBD") == 0
 
 
+def test_clean_numeric_series_matches_scalar():
+    values = [
+        "1.5 metres", "600 mm", "$299.99", "TBD", "", np.nan, "2.4 M", 450, 3.5,
+        "99999999999999999999",
+    ]
+    result = clean_numeric_series(pd.Series(values))
+    assert result.tolist() == [clean_numeric_string(v) for v in values]
+
+
 def test_normalize_dataframe():
     # Single test for full normalization logic
     df = pd.DataFrame({
@@ -73,11 +113,32 @@ def test_normalize_dataframe():
     assert result["product_description"].iloc[0] == "Preserve Case"
 
 
+def test_normalize_dataframe_blanks_missing_text():
+    df = pd.DataFrame({"brand": [np.nan, None, "nan", " acme "]})
+    result = normalize_dataframe(df)
+    assert result["brand"].tolist() == ["", "", "", "ACME"]
+
+
 def test_prepare_data_frame():
     df = pd.DataFrame([["h1", "h2"], ["v1", "v2"], [np.nan, np.nan]])
     result = prepare_data_frame(df, header_row_idx=0)
     assert len(result) == 1 # Only one non-empty row
     assert list(result.columns) == ["h1", "h2"]
+    assert list(df.iloc[0]) == ["h1", "h2"]  # source frame untouched
+
+
+def test_aggregate_groups():
+    df = pd.DataFrame({
+        "code": ["F64", np.nan, "F65"],
+        "desc": [" Chair ", "Oak", np.nan],
+        "qty": [np.nan, 4.0, 1.0],
+        "group_id": [1, 1, 2],
+    })
+    result = aggregate_groups(df, "group_id")
+    assert list(result.columns) == ["code", "desc", "qty"]
+    assert result["code"].tolist() == ["F64", "F65"]
+    assert result["desc"].tolist() == ["Chair\nOak", ""]
+    assert result["qty"].tolist() == [4.0, 1.0]
 
 
 def test_is_meaningful_logic():
@@ -89,3 +150,124 @@ def test_is_meaningful_logic():
     assert is_meaningful({"doc_code": "CLIENT SIGNATURE"}) is False
     assert is_meaningful({"doc_code": "*"}) is False
     assert is_meaningful({"doc_code": "F64", "product_details": "Too sparse"}) is False
+
+
+def test_meaningful_mask_matches_row_logic():
+    rows = [
+        {"doc_code": "F64", "product_name": "Chair"},
+        {"doc_code": "F64", "colour": "Red", "material": "Wood"},
+        {"doc_code": "CLIENT SIGNATURE"},
+        {"doc_code": "*", "product_name": "Chair"},
+        {"doc_code": " ", "brand": "Acme"},
+        {"doc_code": "F64", "product_details": "Too sparse"},
+    ]
+    df = pd.DataFrame(rows)
+    expected = [is_meaningful(r) for r in rows]
+    assert meaningful_mask(df).tolist() == expected
+
+
+def test_meaningful_mask_treats_missing_as_empty():
+    df = pd.DataFrame({"doc_code": [np.nan, "F1", None], "product_name": ["x", np.nan, "y"]})
+    assert meaningful_mask(df).tolist() == [False, False, False]
+
+
+def test_join_labelled():
+    df = pd.DataFrame({
+        "product_name": ["Chair", np.nan, "  "],
+        "brand": ["Acme", "Oak Co", np.nan],
+        "qty": [4, np.nan, np.nan],
+    })
+    result = _join_labelled(df, ["product_name", "brand", "qty"])
+    assert result.tolist() == [
+        "product_name: Chair\nbrand: Acme\nqty: 4.0",
+        "brand: Oak Co",
+        "",
+    ]
+
+
+
+def test_join_labelled_keeps_str_formatting_for_typed_columns():
+    df = pd.DataFrame({
+        "installed": pd.to_datetime(["2024-01-01", None]),
+        "rrp": [150.0, 2.5],
+    })
+    result = _join_labelled(df, ["installed", "rrp"])
+    assert result.tolist() == ["installed: 2024-01-01 00:00:00\nrrp: 150.0", "rrp: 2.5"]
+
+@pytest.mark.asyncio
+async def test_extract_batch_shards_and_reassembles(monkeypatch):
+    shards = []
+
+    async def fake_batch(texts):
+        shards.append(list(texts))
+        return [Product(product_name=t.upper()) for t in texts]
+
+    monkeypatch.setattr(parser, "extract_products_batch_ai", fake_batch)
+    monkeypatch.setattr(parser, "LLM_BATCH_SIZE", 2)
+
+    texts = ["chair", "desk", "table"]
+    result = await _extract_batch(texts)
+    assert shards == [["chair", "desk"], ["table"]]
+    assert {t: r["product_name"] for t, r in result.items()} == {
+        "chair": "CHAIR",
+        "desk": "DESK",
+        "table": "TABLE",
+    }
+
+
+@pytest.mark.asyncio
+async def test_extract_batch_respects_max_concurrency(monkeypatch):
+    in_flight, peak = 0, 0
+
+    async def fake_batch(texts):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return [Product() for _ in texts]
+
+    monkeypatch.setattr(parser, "extract_products_batch_ai", fake_batch)
+    monkeypatch.setattr(parser, "LLM_BATCH_SIZE", 1)
+    monkeypatch.setattr(parser, "LLM_MAX_CONCURRENCY", 2)
+
+    await _extract_batch([f"text {i}" for i in range(6)])
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_header_mapping_llm_skipped_when_heuristic_covers_schema(monkeypatch):
+    calls = []
+
+    async def fake_mapping(raw_headers, fields=None):
+        calls.append(fields)
+        return {}
+
+    async def fake_batch(texts):
+        return [Product() for _ in texts]
+
+    monkeypatch.setattr(parser, "extract_header_mapping", fake_mapping)
+    monkeypatch.setattr(parser, "extract_products_batch_ai", fake_batch)
+
+    headers = [
+        "code", "item", "brand", "colour", "finish", "material",
+        "width", "length", "height", "qty", "price", "description", "notes",
+    ]
+    df = pd.DataFrame([headers, ["F64", "Chair"] + [np.nan] * 11])
+    await parser.extract_products_from_sheet(df, "Sheet1")
+    assert calls == []
+
+    df = pd.DataFrame([["code", "item"], ["F64", "Chair"]])
+    await parser.extract_products_from_sheet(df, "Sheet1")
+    assert len(calls) == 1 and "brand" in calls[0]
+
+
+def test_validate_products_drops_only_invalid_rows():
+    records = [
+        {"doc_code": "F64", "width": 600},
+        {"doc_code": "F65", "width": "not_a_number"},
+        {"doc_code": "F66", "qty": 2},
+    ]
+    products = validate_products(records)
+    assert [p.doc_code for p in products] == ["F64", "F66"]
+    assert products[1].qty == 2